@@ -0,0 +1,129 @@
+import asyncio
+import math
+from enum import IntEnum
+
+from logger import log
+
+# Shed requests come in bursts when the server is overloaded
+log.set_sample_rate("admission", 0.1)
+
+
+class Priority(IntEnum):
+    CRITICAL = 0  # never shed
+    HIGH = 1  # cheap, cacheable reads
+    NORMAL = 2
+    LOW = 3  # expensive work: database writes, push broadcasts
+
+
+# Load (see AdmissionController.load) at which requests of each priority start being shed
+SHED_THRESHOLDS = {
+    Priority.CRITICAL: math.inf,
+    Priority.HIGH: 1.0,
+    Priority.NORMAL: 0.75,
+    Priority.LOW: 0.5,
+}
+
+# Matched in order against the request path, the first prefix that matches wins
+ROUTE_PRIORITIES = [
+    ("/restart", Priority.CRITICAL),
+    ("/hhs/calendar/get-current-date", Priority.HIGH),
+    ("/hhs/calendar/get-period-info", Priority.HIGH),
+    ("/hhs/calendar/get-date/", Priority.HIGH),
+    ("/hhs/calendar/stats/", Priority.HIGH),
+    ("/hhs/calendar/subscription", Priority.LOW),
+    ("/hhs/calendar/admin", Priority.LOW),
+]
+
+
+class AdmissionController:
+    # Tracks in-flight requests and event loop lag, and sheds lower priority work first once the server
+    # is overloaded so cheap routes keep a bounded latency.
+    def __init__(self, max_in_flight=100, max_lag=0.25, retry_after=5, sample_interval=0.1):
+        self.max_in_flight = max_in_flight
+        self.max_lag = max_lag
+        self.retry_after = retry_after
+        self.sample_interval = sample_interval
+        # Connections with an admitted request in flight. HTTP/1 connections serve one request at a time
+        self._admitted = set()
+        self.lag = 0.0
+        self._monitor_task = None
+
+    def configure(self, max_in_flight=None, max_lag=None, retry_after=None):
+        # Both limits divide the current load, so they have to be positive
+        if max_in_flight is not None and max_in_flight <= 0:
+            raise ValueError(f"admission-max-in-flight must be positive, got {max_in_flight}")
+        if max_lag is not None and max_lag <= 0:
+            raise ValueError(f"admission-max-lag must be positive, got {max_lag}")
+        if retry_after is not None and retry_after < 0:
+            raise ValueError(f"admission-retry-after can't be negative, got {retry_after}")
+        if max_in_flight is not None:
+            self.max_in_flight = max_in_flight
+        if max_lag is not None:
+            self.max_lag = max_lag
+        if retry_after is not None:
+            self.retry_after = retry_after
+
+    @staticmethod
+    def priority_for(path):
+        for prefix, priority in ROUTE_PRIORITIES:
+            if path.startswith(prefix):
+                return priority
+        return Priority.NORMAL
+
+    @property
+    def in_flight(self):
+        return len(self._admitted)
+
+    @property
+    def load(self):
+        # 1.0 means either the in-flight limit or the lag limit has been reached
+        return max(self.in_flight / self.max_in_flight, self.lag / self.max_lag)
+
+    def is_overloaded(self, priority):
+        return self.load >= SHED_THRESHOLDS[priority]
+
+    def get_retry_after(self):
+        return max(1, math.ceil(self.retry_after * self.load))
+
+    def acquire(self, conn_info, priority):
+        # Returns False if the request should be shed, otherwise counts it as in flight
+        if self.is_overloaded(priority):
+            return False
+        self._admitted.add(conn_info)
+        return True
+
+    def release(self, conn_info):
+        # Safe to call more than once, and for connections that never had a request admitted
+        self._admitted.discard(conn_info)
+
+    async def wait_for_capacity(self, priority, timeout):
+        # Defers background work (e.g. scheduled broadcasts) until the load drops, for at most timeout seconds
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.is_overloaded(priority) and loop.time() < deadline:
+            await asyncio.sleep(self.sample_interval)
+
+    async def _monitor_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.sample_interval)
+            lag = max(0.0, loop.time() - started - self.sample_interval)
+            # React to spikes immediately but decay slowly so a single quiet sample doesn't reopen the gates
+            self.lag = lag if lag > self.lag else self.lag * 0.8 + lag * 0.2
+
+    def start(self):
+        if self._monitor_task is None or self._monitor_task.done():
+            self._monitor_task = asyncio.get_running_loop().create_task(self._monitor_lag())
+
+    async def stop(self):
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            try:
+                await self._monitor_task
+            except asyncio.CancelledError:
+                pass
+            self._monitor_task = None
+
+
+admission = AdmissionController()
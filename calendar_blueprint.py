@@ -1,10 +1,14 @@
+import asyncio
 import os
 from datetime import datetime, timedelta
+from functools import partial
+from types import SimpleNamespace
 import pytz
 import json
 from typing import Union
 
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from sanic import Blueprint
 from sanic.response import text, json as response_json
 from pywebpush import webpush
@@ -15,7 +19,10 @@ from Scheduler.PeriodTypes import PeriodTypes
 from Scheduler.Scheduler import get_period_info as get_period_info_from_scheduler
 from Scheduler.DayTypes import DayTypes
 
+from admission import Priority, admission
+from calendar_stats import DAY_OFF_GROUP, SCHOOL_DAY_GROUP, build_calendar_index
 from ratelimit import ratelimiter
+from logger import log
 import aiosqlite
 
 from apscheduler.triggers.date import DateTrigger
@@ -26,6 +33,7 @@ DATE_FORMAT = '%Y-%m-%d'
 TIMEZONE = 'US/Eastern'
 SUMMER_END_DATE = datetime(2024, 6, 12)
 WEEKEND_DAYS = [5, 6]
+CALENDAR_FILE_PATH = "./school_calendar.json"
 
 # Create a Blueprint instance
 calendar_blueprint = Blueprint('calendar_blueprint', url_prefix='/hhs/calendar')
@@ -52,15 +60,18 @@ async def handle_daily_scheduling(_app):
 @calendar_blueprint.after_server_stop
 async def shutdown_scheduler(_, __):
     scheduler.shutdown()
+    await log.stop()
 
 
 async def send_web_push(subscription_info, message_body):
-    return webpush(
+    # webpush makes a blocking HTTP request, so run it off the event loop
+    return await asyncio.get_running_loop().run_in_executor(None, partial(
+        webpush,
         subscription_info=subscription_info,
         data=message_body.replace('"', ''),
         vapid_private_key=VAPID_PRIVATE_KEY,
         vapid_claims=VAPID_CLAIMS.copy()
-    )
+    ))
 
 
 @calendar_blueprint.route('/admin/announce', methods=['GET'])
@@ -81,7 +92,13 @@ async def send_notifications(message):
                     token = json.loads(row[0])
                     await send_web_push(token, message)
                 except Exception as e:
-                    print(f"Error sending notification: {e}")
+                    log.error("notifications", "Error sending notification", error=str(e))
+
+
+async def send_scheduled_notifications(message):
+    # Period reminders can wait a little if the server is busy serving requests
+    await admission.wait_for_capacity(Priority.LOW, timeout=60)
+    await send_notifications(message)
 
 
 async def schedule_tasks_for_day(_scheduler, day_type, timezone):
@@ -100,13 +117,14 @@ async def schedule_tasks_for_day(_scheduler, day_type, timezone):
 
         task_time = task_time + timedelta(seconds=30)
 
-        # print all the tasks that would have been ran this day
-        print(f"Task for {period_info['type']} would have been scheduled at {task_time}")
+        # log all the tasks that would have been ran this day
+        log.info("scheduler", "Task would have been scheduled", period=str(period_info['type']),
+                 run_date=task_time.isoformat())
 
         if task_time > now and period_info["type"] not in [PeriodTypes.AFTER_SCHOOL, PeriodTypes.BEFORE_SCHOOL] \
                 and "Transition" not in str(period_info["type"]):
             _scheduler.add_job(
-                send_notifications,
+                send_scheduled_notifications,
                 trigger=DateTrigger(run_date=task_time),
                 args=[f"{period_info['type']} ends in 5 minutes!"],
             )
@@ -164,8 +182,10 @@ DB_FILE = "subscribed_users_notifications.db"
 @calendar_blueprint.listener('before_server_start')
 async def setup(app, _):
     app.ctx.hhs_school_calendar = load_school_calendar()
+    app.ctx.hhs_school_calendar_mtime = os.path.getmtime(CALENDAR_FILE_PATH)
     app.ctx.timezone = pytz.timezone(TIMEZONE)
     app.ctx.cache = {}  # Initialize cache
+    app.ctx.calendar_index = build_app_calendar_index(app.ctx.hhs_school_calendar)
     async with aiosqlite.connect(DB_FILE) as db:
         await db.execute("CREATE TABLE IF NOT EXISTS subscriptions (token TEXT UNIQUE);")
         await db.commit()
@@ -176,6 +196,9 @@ async def setup(app, _):
     except FileNotFoundError:
         raise FileNotFoundError("config.json not found. Please create one.") from None
 
+    log.configure(level=app.ctx.config.get("log-level"), sample_rates=app.ctx.config.get("log-sample-rates"))
+    log.start()
+
     scheduler.start()
 
     # Schedule the daily task check to run at 00:01 every day
@@ -185,12 +208,20 @@ async def setup(app, _):
         args=[app],
     )
 
+    # /restart only runs git pull and the auto reloader only watches python files, so pick up calendar
+    # changes here instead of on the request path
+    scheduler.add_job(
+        reload_school_calendar_if_changed,
+        IntervalTrigger(minutes=1),
+        args=[app],
+    )
+
     # also run the daily scheduling task immediately
     await handle_daily_scheduling(app)
 
 
 def load_school_calendar():
-    file_path = "./school_calendar.json"
+    file_path = CALENDAR_FILE_PATH
     try:
         with open(file_path, "r", encoding="utf-8") as f:
             return json.load(f)
@@ -198,6 +229,41 @@ def load_school_calendar():
         raise FileNotFoundError(f"Calendar data not found at {file_path}. Please create one.") from None
 
 
+def build_app_calendar_index(calendar):
+    # Built against its own context so a new calendar can be indexed before it replaces the current one
+    calendar_ctx = SimpleNamespace(hhs_school_calendar=calendar, cache={})
+    return build_calendar_index(
+        calendar,
+        SUMMER_END_DATE.date(),
+        lambda date_obj: get_calendar_data(calendar_ctx, date_obj.strftime(DATE_FORMAT)),
+    )
+
+
+async def reload_school_calendar_if_changed(_app):
+    try:
+        mtime = os.path.getmtime(CALENDAR_FILE_PATH)
+    except OSError as e:
+        log.error("calendar", "Could not check the school calendar, keeping the current one", error=str(e))
+        return
+    if mtime == _app.ctx.hhs_school_calendar_mtime:
+        return
+
+    try:
+        calendar = load_school_calendar()
+        calendar_index = build_app_calendar_index(calendar)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        # Most likely a half-written file, so keep the current calendar and try again on the next run
+        log.error("calendar", "Could not reload the school calendar, keeping the current one", error=str(e))
+        return
+
+    # Swap everything together so every endpoint sees the same version of the calendar
+    _app.ctx.hhs_school_calendar = calendar
+    _app.ctx.hhs_school_calendar_mtime = mtime
+    _app.ctx.cache = {}
+    _app.ctx.calendar_index = calendar_index
+    log.info("calendar", "Reloaded the school calendar")
+
+
 def get_next_school_day(app_ctx, date_obj):
     next_day = date_obj + timedelta(days=1)
     while True:
@@ -336,7 +402,7 @@ async def get_current_date(request):
     if format_data:
         if get_calendar_data(request.app.ctx, current_date_est, format_data=False)["type"] \
                 not in ['Student Holiday', "Teacher Work Day", "Holiday", "Saturday", "Sunday", "Summer"] \
-                and visited_count(request) < 4:
+                and not admission.is_overloaded(Priority.LOW) and visited_count(request) < 4:
             return text(data + " Visit schedule.soos.dev to view a live clock of the current period. ")
         return text(data)
     else:
@@ -390,8 +456,101 @@ async def get_date(request, date):
     if format_data:
         if get_calendar_data(request.app.ctx, date, format_data=False)["type"] \
                 not in ['Student Holiday', "Teacher Work Day", "Holiday", "Saturday", "Sunday", "Summer"] \
-                and visited_count(request) < 4:
+                and not admission.is_overloaded(Priority.LOW) and visited_count(request) < 4:
             return text(data + " Visit schedule.soos.dev to view a live clock of the current period. ")
         return text(data)
     else:
         return response_json(data)
+
+
+INVALID_DATE_MESSAGE = "Invalid date format. Please use YYYY-MM-DD"
+MULTIPLE_SELECTORS_MESSAGE = "Pass only one of type, group or flag"
+
+
+def parse_date_arg(request, name, default):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    return datetime.strptime(value, DATE_FORMAT).date()
+
+
+def stats_error(message):
+    return response_json({"success": False, "message": message}, status=400)
+
+
+@calendar_blueprint.route("/stats/counts")
+async def get_counts(request):
+    # Counts of each day type, group and flag between start and end (inclusive). Defaults to today until the
+    # end of the calendar. Pass type, group or flag to only count that one.
+    index = request.app.ctx.calendar_index
+    today = datetime.now(request.app.ctx.timezone).date()
+    try:
+        start = parse_date_arg(request, "start", today)
+        end = parse_date_arg(request, "end", index.end)
+    except ValueError:
+        return stats_error(INVALID_DATE_MESSAGE)
+
+    data = {"success": True, "start": start.isoformat(), "end": end.isoformat()}
+    day_type = request.args.get("type")
+    group = request.args.get("group")
+    flag = request.args.get("flag")
+    selectors = sum(value is not None for value in (day_type, group, flag))
+    if selectors > 1:
+        return stats_error(MULTIPLE_SELECTORS_MESSAGE)
+    if selectors:
+        data["count"] = index.count(start, end, day_type=day_type, group=group, flag=flag)
+    else:
+        data.update(index.count_all(start, end))
+    return response_json(data)
+
+
+@calendar_blueprint.route("/stats/days-left")
+async def get_days_left(request):
+    # School days left in the year, counting today
+    index = request.app.ctx.calendar_index
+    today = datetime.now(request.app.ctx.timezone).date()
+    last_day = index.next(today, flag="End of School Year")
+    return response_json({
+        "success": True,
+        "school_days_left": index.count(today, index.end, group=SCHOOL_DAY_GROUP),
+        "last_day": last_day.isoformat() if last_day else None,
+    })
+
+
+@calendar_blueprint.route("/stats/next")
+async def get_next(request):
+    # Next date (on or after "from", default today) with the given type, group or flag
+    day_type = request.args.get("type")
+    group = request.args.get("group")
+    flag = request.args.get("flag")
+    selectors = sum(value is not None for value in (day_type, group, flag))
+    if not selectors:
+        return stats_error("Pass a type, group or flag to search for")
+    if selectors > 1:
+        return stats_error(MULTIPLE_SELECTORS_MESSAGE)
+
+    index = request.app.ctx.calendar_index
+    try:
+        start = parse_date_arg(request, "from", datetime.now(request.app.ctx.timezone).date())
+    except ValueError:
+        return stats_error(INVALID_DATE_MESSAGE)
+
+    next_date = index.next(start, day_type=day_type, group=group, flag=flag)
+    return response_json({
+        "success": True,
+        "date": next_date.isoformat() if next_date else None,
+        "days_until": (next_date - start).days if next_date else None,
+    })
+
+
+@calendar_blueprint.route("/stats/next-holiday")
+async def get_next_holiday(request):
+    index = request.app.ctx.calendar_index
+    today = datetime.now(request.app.ctx.timezone).date()
+    next_date = index.next(today, group=DAY_OFF_GROUP)
+    return response_json({
+        "success": True,
+        "date": next_date.isoformat() if next_date else None,
+        "days_until": (next_date - today).days if next_date else None,
+        "school_days_until": index.count(today, next_date, group=SCHOOL_DAY_GROUP) if next_date else None,
+    })
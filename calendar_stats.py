@@ -0,0 +1,103 @@
+from datetime import date, timedelta
+
+SCHOOL_DAY_TYPES = ["Black Day", "Red Day"]
+HOLIDAY_TYPES = ["Student Holiday", "Teacher Work Day", "Holiday"]
+
+# Groups of several day types, queried separately from the raw types so the names can't clash
+SCHOOL_DAY_GROUP = "school_day"
+DAY_OFF_GROUP = "day_off"
+GROUPS = {
+    SCHOOL_DAY_GROUP: SCHOOL_DAY_TYPES,
+    DAY_OFF_GROUP: HOLIDAY_TYPES,
+}
+
+
+class CalendarIndex:
+    # Prefix counts and next-occurrence tables over every day between start and end (inclusive), so
+    # range counts and "next <type>" lookups are answered in constant time. Built once per calendar load.
+    def __init__(self, start, end, get_day_data):
+        self.start = start
+        self.end = end
+        self.days = (end - start).days + 1
+        # (kind, name) -> per-day 0/1 markers, where kind is "type", "group" or "flag"
+        markers = {}
+
+        for offset in range(self.days):
+            day_data = get_day_data(start + timedelta(days=offset))
+            keys = [("type", day_data["type"])]
+            keys.extend(("group", group) for group, day_types in GROUPS.items() if day_data["type"] in day_types)
+            keys.extend(("flag", flag) for flag in day_data.get("flags", []))
+            for key in keys:
+                markers.setdefault(key, [0] * self.days)[offset] = 1
+
+        # counts[i] is the number of matching days before offset i,
+        # next_offsets[i] is the first matching offset at or after i (None if there is none)
+        self.counts = {}
+        self.next_offsets = {}
+        for key, day_markers in markers.items():
+            counts = [0] * (self.days + 1)
+            next_offsets = [None] * (self.days + 1)
+            for offset in range(self.days):
+                counts[offset + 1] = counts[offset] + day_markers[offset]
+            for offset in range(self.days - 1, -1, -1):
+                next_offsets[offset] = offset if day_markers[offset] else next_offsets[offset + 1]
+            self.counts[key] = counts
+            self.next_offsets[key] = next_offsets
+
+    @property
+    def types(self):
+        return [name for kind, name in self.counts if kind == "type"]
+
+    @property
+    def groups(self):
+        return [name for kind, name in self.counts if kind == "group"]
+
+    @property
+    def flags(self):
+        return [name for kind, name in self.counts if kind == "flag"]
+
+    def _offset(self, date_obj):
+        return max(0, min(self.days, (date_obj - self.start).days))
+
+    @staticmethod
+    def _key(day_type=None, group=None, flag=None):
+        if sum(value is not None for value in (day_type, group, flag)) > 1:
+            raise ValueError("Only one of day_type, group or flag can be given")
+        if flag is not None:
+            return "flag", flag
+        if group is not None:
+            return "group", group
+        return "type", day_type
+
+    def count(self, start, end, day_type=None, group=None, flag=None):
+        # Number of days between start and end (inclusive) with the given type, group or flag
+        counts = self.counts.get(self._key(day_type, group, flag))
+        if counts is None or end < start:
+            return 0
+        return counts[self._offset(end + timedelta(days=1))] - counts[self._offset(start)]
+
+    def count_all(self, start, end):
+        lo = self._offset(start)
+        hi = max(lo, self._offset(end + timedelta(days=1)))
+        result = {"types": {}, "groups": {}, "flags": {}}
+        for (kind, name), counts in self.counts.items():
+            result[kind + "s"][name] = counts[hi] - counts[lo]
+        return result
+
+    def next(self, date_obj, day_type=None, group=None, flag=None):
+        # First date on or after date_obj with the given type, group or flag, or None if there is none left
+        next_offsets = self.next_offsets.get(self._key(day_type, group, flag))
+        if next_offsets is None or date_obj > self.end:
+            return None
+        offset = next_offsets[self._offset(date_obj)]
+        if offset is None:
+            return None
+        return self.start + timedelta(days=offset)
+
+
+def build_calendar_index(calendar, last_day, get_day_data):
+    # calendar is the raw school_calendar.json mapping, last_day is the last date the index has to cover
+    dates = [date.fromisoformat(date_str) for date_str in calendar]
+    start = min(dates)
+    end = max(*dates, last_day)
+    return CalendarIndex(start, end, get_day_data)
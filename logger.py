@@ -0,0 +1,136 @@
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import deque
+from enum import IntEnum
+
+
+class LogLevel(IntEnum):
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    ERROR = 40
+
+
+class StructuredLogger:
+    # Records are queued in memory and written in batches by a background task, so request
+    # handlers never block on stdout. When the queue is full new records are dropped and counted.
+    def __init__(self, stream=sys.stdout, level=LogLevel.INFO, max_queue_size=10000, flush_interval=0.5):
+        self.stream = stream
+        self.level = level
+        self.max_queue_size = max_queue_size
+        self.flush_interval = flush_interval
+        self.sample_rates = {}
+        self.queue = deque()
+        self.dropped = 0
+        self._writer_task = None
+        self._stopping = None
+
+    def configure(self, level=None, sample_rates=None):
+        if level is not None:
+            self.level = LogLevel[level.upper()] if isinstance(level, str) else LogLevel(level)
+        if sample_rates:
+            for category, rate in sample_rates.items():
+                self.set_sample_rate(category, rate)
+
+    def set_sample_rate(self, category, rate):
+        # rate is the fraction of records kept for the category, e.g. 0.01 keeps 1%
+        self.sample_rates[category] = max(0.0, min(1.0, float(rate)))
+
+    def log(self, level, category, message, **fields):
+        if level < self.level:
+            return
+        rate = self.sample_rates.get(category, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            return
+        if len(self.queue) >= self.max_queue_size:
+            self.dropped += 1
+            return
+        self.queue.append({
+            "time": time.time(),
+            "level": LogLevel(level).name,
+            "category": category,
+            "message": message,
+            **fields,
+        })
+
+    def debug(self, category, message, **fields):
+        self.log(LogLevel.DEBUG, category, message, **fields)
+
+    def info(self, category, message, **fields):
+        self.log(LogLevel.INFO, category, message, **fields)
+
+    def warning(self, category, message, **fields):
+        self.log(LogLevel.WARNING, category, message, **fields)
+
+    def error(self, category, message, **fields):
+        self.log(LogLevel.ERROR, category, message, **fields)
+
+    def _drain(self):
+        # Returns the queued records plus a report of how many were dropped since the last drain
+        records = []
+        while self.queue:
+            records.append(self.queue.popleft())
+        dropped = self.dropped
+        if dropped:
+            records.append({
+                "time": time.time(),
+                "level": LogLevel.WARNING.name,
+                "category": "logger",
+                "message": "Dropped log records because the queue was full or the stream could not be written",
+                "dropped": dropped,
+            })
+            self.dropped = 0
+        return records, dropped
+
+    def _write_failed(self, records, dropped):
+        # The unwritten records count as dropped, as do the ones the drop report was covering
+        self.dropped += len(records) - (1 if dropped else 0) + dropped
+
+    def _write(self, records):
+        self.stream.write("".join(json.dumps(record, default=str) + "\n" for record in records))
+        self.stream.flush()
+
+    def flush(self):
+        # Synchronous flush, used at shutdown once the event loop no longer serves requests
+        records, dropped = self._drain()
+        if records:
+            try:
+                self._write(records)
+            except (OSError, ValueError):
+                self._write_failed(records, dropped)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            records, dropped = self._drain()
+            if records:
+                # Do the blocking write in the default executor instead of on the event loop
+                try:
+                    await loop.run_in_executor(None, self._write, records)
+                except (OSError, ValueError):
+                    # e.g. a broken pipe or closed stdout; keep the writer alive and report the loss later
+                    self._write_failed(records, dropped)
+
+    def start(self):
+        if self._writer_task is None or self._writer_task.done():
+            self._stopping = asyncio.Event()
+            self._writer_task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._writer_task is not None:
+            # Let the writer finish its current batch instead of cancelling it mid-write, so the final
+            # flush below can't interleave with it
+            self._stopping.set()
+            await self._writer_task
+            self._writer_task = None
+        self.flush()
+
+
+log = StructuredLogger()
@@ -4,7 +4,7 @@ import subprocess
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from sanic import Sanic
-from sanic.response import redirect, text
+from sanic.response import redirect, text, json as response_json
 from sanic.exceptions import NotFound
 from sanic_cors import CORS
 
@@ -14,13 +14,44 @@ try:
 except FileNotFoundError:
     raise FileNotFoundError("config.json not found. Please create one.") from None
 
+from admission import admission
 from calendar_blueprint import calendar_blueprint
+from logger import log
 
 app = Sanic(__name__)
 app.blueprint(calendar_blueprint)
 schedule = AsyncIOScheduler()
 
 
+@app.middleware("request")
+async def admission_control(request):
+    priority = admission.priority_for(request.path)
+    if not admission.acquire(request.conn_info, priority):
+        retry_after = admission.get_retry_after()
+        log.warning("admission", "Shed request", path=request.path, priority=priority.name,
+                    in_flight=admission.in_flight, lag=round(admission.lag, 3))
+        return response_json(
+            {
+                "success": False,
+                "retryAfter": retry_after,
+                "message": "Server is overloaded, please try again later"
+            },
+            headers={"Retry-After": str(retry_after), "Cache-Control": "no-store"},
+            status=503)
+
+
+@app.middleware("response")
+async def release_admission(request, _):
+    admission.release(request.conn_info)
+
+
+@app.signal("http.lifecycle.complete")
+async def release_admission_on_close(conn_info):
+    # Response middleware is skipped when a handler is cancelled (client disconnect, response timeout), but
+    # the connection is closed afterwards, so release its slot here as well
+    admission.release(conn_info)
+
+
 @app.middleware("response")
 async def cors(_, response):
     response.headers.update(
@@ -55,6 +86,21 @@ async def initialize_scheduler(_, loop):
     schedule.start()
 
 
+@app.listener('before_server_start')
+async def start_admission_control(_, __):
+    admission.configure(
+        max_in_flight=config.get("admission-max-in-flight"),
+        max_lag=config.get("admission-max-lag"),
+        retry_after=config.get("admission-retry-after"),
+    )
+    admission.start()
+
+
+@app.listener('after_server_stop')
+async def stop_admission_control(_, __):
+    await admission.stop()
+
+
 if __name__ == "__main__":
     app.ctx.config = config
     app.run(host="0.0.0.0",
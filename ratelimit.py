@@ -1,13 +1,19 @@
 from enum import Enum
 from discord.ext import commands
 
+from logger import log
+
+# Per-request rate limit keys are only useful as a sample
+log.set_sample_rate("ratelimit", 0.01)
+
 
 class BucketType(Enum):
     ip = 0
 
     def get_key(self, request):
-        print(request.headers.get("cf-connecting-ip"))
-        return request.headers.get("cf-connecting-ip")
+        key = request.headers.get("cf-connecting-ip")
+        log.info("ratelimit", "Rate limit key", ip=key)
+        return key
 
     def __call__(self, request):
         return self.get_key(request)